@@ -0,0 +1,332 @@
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Any, List, Mapping, Optional, Set, Tuple
+
+from aimakerspace.openai_utils.chatmodel import ChatMessage, ChatOpenAI
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def message_hash(message: Mapping[str, Any]) -> str:
+    """Return a stable hash of a message's role and content."""
+
+    payload = f"{message.get('role', '')}\x00{message.get('content') or ''}"
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class TokenCounter:
+    """Approximate per-message token counts, cached by message hash.
+
+    Uses the common ~4 characters per token heuristic plus a small per-message
+    overhead for the role/formatting tokens the chat format adds.
+    """
+
+    def __init__(
+        self,
+        chars_per_token: float = 4.0,
+        message_overhead: int = 4,
+        max_cache_entries: int = 10_000,
+    ):
+        self.chars_per_token = chars_per_token
+        self.message_overhead = message_overhead
+        self.max_cache_entries = max_cache_entries
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+
+    def count_text(self, text: str) -> int:
+        """Return the estimated number of tokens in ``text``."""
+
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def count_message(self, message: Mapping[str, Any], key: Optional[str] = None) -> int:
+        """Return the estimated token cost of ``message``, using the cache."""
+
+        key = key or message_hash(message)
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        count = self.message_overhead + self.count_text(str(message.get("content") or ""))
+        self._cache[key] = count
+        if len(self._cache) > self.max_cache_entries:
+            self._cache.popitem(last=False)
+        return count
+
+    def count_messages(self, messages: List[Mapping[str, Any]]) -> int:
+        """Return the estimated token cost of all ``messages``."""
+
+        return sum(self.count_message(message) for message in messages)
+
+
+class ConversationHistoryManager:
+    """Fit conversation history into a token budget.
+
+    Recent turns are kept verbatim. Older turns are replaced by a running
+    summary which is extended in the background whenever more turns fall out
+    of the window, so building a prompt never waits on a summarization call.
+    Until a summary for the newest evicted turns is ready, the most recent
+    available summary is used and the uncovered turns are dropped.
+
+    Evicted turns are folded into the summary oldest first in chunks of at
+    most ``summary_input_token_budget`` tokens. When more than
+    ``max_summary_chunks`` chunks are uncovered (e.g. after a restart), only
+    the newest ones are summarized. After a failed summary call the
+    conversation is not summarized again for ``summary_retry_seconds``.
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 6000,
+        summary_token_budget: int = 400,
+        counter: Optional[TokenCounter] = None,
+        max_summaries: int = 1000,
+        summary_input_token_budget: int = 8000,
+        max_summary_chunks: int = 4,
+        summary_retry_seconds: float = 300.0,
+    ):
+        if token_budget <= 0:
+            raise ValueError("token_budget must be a positive integer")
+        if summary_input_token_budget <= 0 or max_summary_chunks <= 0:
+            raise ValueError(
+                "summary_input_token_budget and max_summary_chunks must be positive"
+            )
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.counter = counter or TokenCounter()
+        self.max_summaries = max_summaries
+        self.summary_input_token_budget = summary_input_token_budget
+        self.max_summary_chunks = max_summary_chunks
+        self.summary_retry_seconds = summary_retry_seconds
+        # Maps the chained hash of an evicted history prefix to its summary.
+        self._summaries: "OrderedDict[str, str]" = OrderedDict()
+        # Maps a conversation's first-message key to when it may be retried.
+        self._failed_until: "OrderedDict[str, float]" = OrderedDict()
+        self._pending: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def wait_for_summaries(self) -> None:
+        """Wait until all scheduled background summaries have finished."""
+
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def build_messages(
+        self,
+        system_message: str,
+        history: List[ChatMessage],
+        user_message: str,
+        chat_model: Optional[ChatOpenAI] = None,
+    ) -> List[ChatMessage]:
+        """Return the prompt messages for a chat turn within ``token_budget``.
+
+        When ``chat_model`` is given and turns had to be evicted without an
+        up-to-date summary, a background task is scheduled on the running
+        event loop to summarize them for the following turns.
+        """
+
+        system = {"role": "system", "content": system_message}
+        user = {"role": "user", "content": user_message}
+        remaining = self.token_budget - self.counter.count_messages([system, user])
+
+        message_keys = [message_hash(message) for message in history]
+        costs = [
+            self.counter.count_message(message, key)
+            for message, key in zip(history, message_keys)
+        ]
+
+        split = self._split_index(costs, remaining)
+        if split > 0:
+            # Keep room for the summary message that replaces the evicted turns.
+            split = self._split_index(costs, remaining - self.summary_token_budget)
+
+        messages: List[ChatMessage] = [system]
+        if split > 0:
+            prefix_keys = self._prefix_keys(message_keys[:split])
+            covered, summary = self._latest_summary(prefix_keys)
+            if summary is not None:
+                summary_message = self._summary_message(summary)
+                if self.counter.count_message(summary_message) <= self.summary_token_budget:
+                    messages.append(summary_message)
+            if covered < split and chat_model is not None:
+                self._schedule_summary(
+                    prefix_keys[0],
+                    summary,
+                    history[covered:split],
+                    prefix_keys[covered:split],
+                    chat_model,
+                )
+
+        messages.extend(history[split:])
+        messages.append(user)
+        return messages
+
+    def _summary_message(self, summary: str) -> ChatMessage:
+        return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+    def _summary_text_budget(self) -> int:
+        """Return the tokens left for summary text once prefix and overhead are paid."""
+
+        return self.summary_token_budget - self.counter.count_message(
+            self._summary_message("")
+        )
+
+    def _fit_summary(self, summary: str) -> str:
+        """Trim ``summary`` at a word boundary so its message fits the reserve."""
+
+        if self.counter.count_message(self._summary_message(summary)) <= self.summary_token_budget:
+            return summary
+        max_chars = max(int(self._summary_text_budget() * self.counter.chars_per_token), 0)
+        trimmed = summary[:max_chars]
+        if " " in trimmed:
+            trimmed = trimmed.rsplit(" ", 1)[0]
+        return trimmed.rstrip()
+
+    def _split_index(self, costs: List[int], remaining: int) -> int:
+        """Return the index of the oldest message kept verbatim."""
+
+        split = len(costs)
+        while split > 0 and costs[split - 1] <= remaining:
+            remaining -= costs[split - 1]
+            split -= 1
+        return split
+
+    def _prefix_keys(self, message_keys: List[str]) -> List[str]:
+        """Return chained hashes identifying each prefix of the history."""
+
+        keys = []
+        previous = ""
+        for key in message_keys:
+            previous = hashlib.sha1(f"{previous}{key}".encode("utf-8")).hexdigest()
+            keys.append(previous)
+        return keys
+
+    def _latest_summary(self, prefix_keys: List[str]) -> Tuple[int, Optional[str]]:
+        """Return ``(length, summary)`` for the longest already summarized prefix."""
+
+        for length in range(len(prefix_keys), 0, -1):
+            summary = self._summaries.get(prefix_keys[length - 1])
+            if summary is not None:
+                self._summaries.move_to_end(prefix_keys[length - 1])
+                return length, summary
+        return 0, None
+
+    def _schedule_summary(
+        self,
+        conversation_key: str,
+        previous_summary: Optional[str],
+        new_messages: List[ChatMessage],
+        new_keys: List[str],
+        chat_model: ChatOpenAI,
+    ) -> None:
+        key = new_keys[-1]
+        if key in self._pending:
+            return
+        if self._failed_until.get(conversation_key, 0.0) > time.monotonic():
+            return
+        self._pending.add(key)
+        task = asyncio.create_task(
+            self._summarize(
+                conversation_key, previous_summary, new_messages, new_keys, chat_model
+            )
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _chunk_messages(
+        self, messages: List[ChatMessage], keys: List[str]
+    ) -> List[Tuple[List[ChatMessage], str]]:
+        """Split ``messages`` into ``(chunk, prefix_key)`` pairs within the input budget.
+
+        A single message larger than the budget is truncated. Only the newest
+        ``max_summary_chunks`` chunks are returned.
+        """
+
+        max_chars = int(self.summary_input_token_budget * self.counter.chars_per_token)
+        chunks: List[Tuple[List[ChatMessage], str]] = []
+        chunk: List[ChatMessage] = []
+        chunk_tokens = 0
+        for message, key in zip(messages, keys):
+            tokens = self.counter.count_message(message)
+            if tokens > self.summary_input_token_budget:
+                content = str(message.get("content") or "")[:max_chars]
+                message = {**message, "content": content}
+                tokens = self.summary_input_token_budget
+            if chunk and chunk_tokens + tokens > self.summary_input_token_budget:
+                chunks.append((chunk, previous_key))
+                chunk, chunk_tokens = [], 0
+            chunk.append(message)
+            chunk_tokens += tokens
+            previous_key = key
+        if chunk:
+            chunks.append((chunk, previous_key))
+        return chunks[-self.max_summary_chunks :]
+
+    async def _summarize(
+        self,
+        conversation_key: str,
+        previous_summary: Optional[str],
+        new_messages: List[ChatMessage],
+        new_keys: List[str],
+        chat_model: ChatOpenAI,
+    ) -> None:
+        try:
+            if self._summary_text_budget() <= 0:
+                return
+            summary = previous_summary
+            for chunk, key in self._chunk_messages(new_messages, new_keys):
+                summary = await self._summarize_chunk(summary, chunk, chat_model)
+                if not summary:
+                    return
+                # Store every step so a later failure keeps the progress made.
+                self._summaries[key] = summary
+                if len(self._summaries) > self.max_summaries:
+                    self._summaries.popitem(last=False)
+        except Exception as e:
+            print(f"Error summarizing conversation history: {e}")
+            self._failed_until[conversation_key] = (
+                time.monotonic() + self.summary_retry_seconds
+            )
+            if len(self._failed_until) > self.max_summaries:
+                self._failed_until.popitem(last=False)
+        finally:
+            self._pending.discard(new_keys[-1])
+
+    async def _summarize_chunk(
+        self,
+        previous_summary: Optional[str],
+        messages: List[ChatMessage],
+        chat_model: ChatOpenAI,
+    ) -> str:
+        """Fold ``messages`` into ``previous_summary`` with one model call."""
+
+        transcript = "\n".join(
+            f"{message.get('role', 'user')}: {message.get('content') or ''}"
+            for message in messages
+        )
+        # The reserve is checked with the character estimate, so ask the model
+        # for noticeably fewer real tokens and words than it allows.
+        max_tokens = max(int(self._summary_text_budget() * 0.75), 1)
+        max_words = max(int(max_tokens * 0.75), 1)
+        prompt = [
+            {
+                "role": "system",
+                "content": (
+                    "You maintain a concise running summary of a conversation between a user "
+                    "and a health assistant. Merge the new messages into the existing summary. "
+                    "Keep facts, lab values, user details and open questions; drop small talk. "
+                    f"Use at most {max_words} words. Reply with the updated summary only."
+                ),
+            },
+            {
+                "role": "user",
+                "content": (
+                    f"Existing summary:\n{previous_summary or '(none)'}\n\n"
+                    f"New messages:\n{transcript}"
+                ),
+            },
+        ]
+        summary = await chat_model.arun(prompt, max_tokens=max_tokens)
+        return self._fit_summary(summary or "")
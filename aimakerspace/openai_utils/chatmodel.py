@@ -1,20 +1,246 @@
+import asyncio
 import os
-from typing import Any, AsyncIterator, Iterable, List, MutableMapping
-from openai import AsyncOpenAI, OpenAI
+import random
+import re
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    MutableMapping,
+    Optional,
+    Tuple,
+)
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    AsyncOpenAI,
+    OpenAI,
+    RateLimitError,
+)
 
 ChatMessage = MutableMapping[str, Any]
 
+USAGE_FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+# Status codes the OpenAI SDK itself treats as transient (besides 429).
+_RETRYABLE_STATUS_CODES = (408, 409)
+
+_RATE_LIMIT_WINDOWS = ("requests", "tokens")
+
+
+@dataclass
+class BatchItemResult:
+    """Outcome of a single conversation submitted through ``abatch``."""
+
+    index: int
+    output: Any = None
+    error: Optional[BaseException] = None
+    usage: Dict[str, int] = field(default_factory=dict)
+    attempts: int = 0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchResult:
+    """Ordered per-item results of ``abatch`` plus aggregated token usage."""
+
+    results: List[BatchItemResult]
+
+    @property
+    def outputs(self) -> List[Any]:
+        return [result.output for result in self.results]
+
+    @property
+    def errors(self) -> List[BatchItemResult]:
+        return [result for result in self.results if not result.ok]
+
+    @property
+    def usage(self) -> Dict[str, int]:
+        totals = {name: 0 for name in USAGE_FIELDS}
+        for result in self.results:
+            for name in USAGE_FIELDS:
+                totals[name] += result.usage.get(name, 0)
+        return totals
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_SCALE = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse ``Retry-After`` style seconds or OpenAI reset values like ``6m0s``."""
+
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_SCALE[unit] for amount, unit in parts)
+
+
+def _retry_delay_from_headers(headers: Optional[Mapping[str, str]]) -> Optional[float]:
+    """Return how long the API asked us to wait, if it said so."""
+
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(float(retry_after_ms) / 1000.0, 0.0)
+        except ValueError:
+            pass
+    retry_after = _parse_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return retry_after
+    return _rate_limit_reset(headers)
+
+
+def _rate_limit_reset(
+    headers: Mapping[str, str], exhausted_only: bool = False
+) -> Optional[float]:
+    """Return the reset time of the request/token window that is limiting us.
+
+    Prefers windows whose ``x-ratelimit-remaining-*`` is ``0``; otherwise (unless
+    ``exhausted_only``) falls back to the longest advertised reset.
+    """
+
+    resets = {
+        kind: _parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+        for kind in _RATE_LIMIT_WINDOWS
+    }
+    exhausted = [
+        resets[kind]
+        for kind in _RATE_LIMIT_WINDOWS
+        if headers.get(f"x-ratelimit-remaining-{kind}") == "0"
+    ]
+    if exhausted:
+        known = [reset for reset in exhausted if reset is not None]
+        # An exhausted window without a reset time still means "pause".
+        return max(known) if known else 1.0
+    if exhausted_only:
+        return None
+    known = [reset for reset in resets.values() if reset is not None]
+    return max(known) if known else None
+
+
+def _is_quota_error(error: RateLimitError) -> bool:
+    """Return whether a 429 means the account is out of quota (never succeeds)."""
+
+    return getattr(error, "code", None) == "insufficient_quota"
+
+
+def _is_transient_error(error: Exception) -> bool:
+    """Return whether ``error`` is a connection/timeout/5xx style failure."""
+
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return (
+            error.status_code >= 500 or error.status_code in _RETRYABLE_STATUS_CODES
+        )
+    return False
+
+
+def _backoff_delay(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Exponential backoff with full jitter for the given 1-based ``attempt``."""
+
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class _AdaptiveLimiter:
+    """Bound in-flight requests and shrink/grow the bound based on 429s.
+
+    A rate-limit response halves the concurrency limit (once per pause window,
+    so a burst of 429s counts as one signal) and pauses every worker until the
+    server-provided reset time. Each run of ``limit`` consecutive
+    successes raises the limit by one, back up to ``max_concurrency``.
+    """
+
+    def __init__(self, max_concurrency: int):
+        if max_concurrency <= 0:
+            raise ValueError("max_concurrency must be a positive integer")
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self._in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._condition:
+            while True:
+                delay = self._resume_at - loop.time()
+                if delay <= 0 and self._in_flight < self.limit:
+                    break
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._condition.wait()
+            self._in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self._in_flight -= 1
+            self._condition.notify()
+
+    async def record_success(self, headers: Optional[Mapping[str, str]]) -> None:
+        async with self._condition:
+            self._successes += 1
+            if self.limit < self.max_concurrency and self._successes >= self.limit:
+                self.limit += 1
+                self._successes = 0
+            # Pre-emptively pause when a request/token window is exhausted.
+            reset = _rate_limit_reset(headers, exhausted_only=True) if headers else None
+            if reset is not None:
+                self._pause(reset)
+            self._condition.notify_all()
+
+    async def record_rate_limited(self, retry_after: Optional[float]) -> None:
+        async with self._condition:
+            if asyncio.get_running_loop().time() >= self._resume_at:
+                self.limit = max(1, self.limit // 2)
+            self._successes = 0
+            self._pause(retry_after)
+            self._condition.notify_all()
+
+    def _pause(self, delay: Optional[float]) -> None:
+        delay = 1.0 if delay is None else delay
+        loop = asyncio.get_running_loop()
+        self._resume_at = max(self._resume_at, loop.time() + delay)
+
 
 class ChatOpenAI:
     """Thin wrapper around the OpenAI chat completion APIs."""
 
-    def __init__(self, model_name: str = "gpt-4o-mini", api_key: str = None):
+    def __init__(
+        self,
+        model_name: str = "gpt-4o-mini",
+        api_key: str = None,
+        base_url: str = None,
+    ):
         """
         Initialize the ChatOpenAI instance.
 
         Args:
             model_name (str): The name of the OpenAI chat model to use.
             api_key (str, optional): The OpenAI API key. If not provided, will attempt to load from environment variable OPENAI_API_KEY.
+            base_url (str, optional): Alternative chat-completions endpoint, e.g. a local mock server. Defaults to the OpenAI API.
 
         Raises:
             ValueError: If no API key is provided and OPENAI_API_KEY is not set in the environment.
@@ -25,8 +251,8 @@ class ChatOpenAI:
         if self.openai_api_key is None:
             raise ValueError("OPENAI_API_KEY is not set and no api_key was provided.")
 
-        self._client = OpenAI(api_key=self.openai_api_key)
-        self._async_client = AsyncOpenAI(api_key=self.openai_api_key)
+        self._client = OpenAI(api_key=self.openai_api_key, base_url=base_url)
+        self._async_client = AsyncOpenAI(api_key=self.openai_api_key, base_url=base_url)
 
     def run(
         self,
@@ -52,6 +278,24 @@ class ChatOpenAI:
 
         return response
 
+    async def arun(
+        self,
+        messages: Iterable[ChatMessage],
+        text_only: bool = True,
+        **kwargs: Any,
+    ) -> Any:
+        """Async counterpart of ``run`` using the async client."""
+
+        message_list = self._coerce_messages(messages)
+        response = await self._async_client.chat.completions.create(
+            model=self.model_name, messages=message_list, **kwargs
+        )
+
+        if text_only:
+            return response.choices[0].message.content
+
+        return response
+
     async def astream(
         self, messages: Iterable[ChatMessage], **kwargs: Any
     ) -> AsyncIterator[str]:
@@ -67,6 +311,136 @@ class ChatOpenAI:
             if content is not None:
                 yield content
 
+    async def abatch(
+        self,
+        batch: Iterable[Iterable[ChatMessage]],
+        text_only: bool = True,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        **kwargs: Any,
+    ) -> BatchResult:
+        """Run many chat completions concurrently and return them in input order.
+
+        Failures are captured on the matching ``BatchItemResult`` instead of
+        aborting the batch. See ``abatch_as_completed`` for the rate limiting
+        behaviour.
+        """
+
+        results = [
+            result
+            async for result in self.abatch_as_completed(
+                batch,
+                text_only=text_only,
+                max_concurrency=max_concurrency,
+                max_retries=max_retries,
+                **kwargs,
+            )
+        ]
+        results.sort(key=lambda result: result.index)
+        return BatchResult(results=results)
+
+    async def abatch_as_completed(
+        self,
+        batch: Iterable[Iterable[ChatMessage]],
+        text_only: bool = True,
+        max_concurrency: int = 8,
+        max_retries: int = 5,
+        **kwargs: Any,
+    ) -> AsyncIterator[BatchItemResult]:
+        """Yield ``BatchItemResult`` objects as soon as each completion finishes.
+
+        At most ``max_concurrency`` requests are in flight. A 429 response
+        halves that limit and pauses all workers until the ``retry-after`` or
+        ``x-ratelimit-reset-*`` time, after which the item is retried.
+        Connection errors, timeouts, 408/409 and 5xx responses are retried with
+        jittered exponential backoff. Each item gets up to ``max_retries``
+        retries in total; other errors, including ``insufficient_quota``, fail
+        it immediately. Use ``result.index`` to map results back to the input
+        order.
+        """
+
+        pending: "asyncio.Queue[Tuple[int, List[ChatMessage]]]" = asyncio.Queue()
+        for index, messages in enumerate(batch):
+            pending.put_nowait((index, self._coerce_messages(messages)))
+        total = pending.qsize()
+        finished: "asyncio.Queue[BatchItemResult]" = asyncio.Queue()
+
+        limiter = _AdaptiveLimiter(max_concurrency)
+        # The batch owns retry/backoff so that every 429 reaches the limiter.
+        client = self._async_client.with_options(max_retries=0)
+
+        async def worker() -> None:
+            while not pending.empty():
+                index, messages = pending.get_nowait()
+                result = await self._run_batch_item(
+                    client, limiter, index, messages, text_only, max_retries, kwargs
+                )
+                finished.put_nowait(result)
+
+        # A fixed pool of workers keeps scheduling cost independent of batch size.
+        workers = [
+            asyncio.create_task(worker()) for _ in range(min(max_concurrency, total))
+        ]
+
+        try:
+            for _ in range(total):
+                yield await finished.get()
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run_batch_item(
+        self,
+        client: AsyncOpenAI,
+        limiter: _AdaptiveLimiter,
+        index: int,
+        messages: List[ChatMessage],
+        text_only: bool,
+        max_retries: int,
+        kwargs: Dict[str, Any],
+    ) -> BatchItemResult:
+        result = BatchItemResult(index=index)
+        while True:
+            result.attempts += 1
+            await limiter.acquire()
+            try:
+                raw = await client.chat.completions.with_raw_response.create(
+                    model=self.model_name, messages=messages, **kwargs
+                )
+                response = raw.parse()
+            except RateLimitError as error:
+                await limiter.release()
+                if _is_quota_error(error):
+                    result.error = error
+                    return result
+                headers = error.response.headers if error.response is not None else None
+                # The limiter pauses the next ``acquire`` until the reset time.
+                await limiter.record_rate_limited(_retry_delay_from_headers(headers))
+                if result.attempts > max_retries:
+                    result.error = error
+                    return result
+                continue
+            except Exception as error:
+                await limiter.release()
+                if not _is_transient_error(error) or result.attempts > max_retries:
+                    result.error = error
+                    return result
+                await asyncio.sleep(_backoff_delay(result.attempts))
+                continue
+
+            await limiter.release()
+            await limiter.record_success(raw.headers)
+            if response.usage is not None:
+                result.usage = {
+                    name: getattr(response.usage, name, None) or 0
+                    for name in USAGE_FIELDS
+                }
+            result.output = (
+                response.choices[0].message.content if text_only else response
+            )
+            return result
+
     def _coerce_messages(self, messages: Iterable[ChatMessage]) -> List[ChatMessage]:
         if isinstance(messages, list):
             return messages
@@ -17,10 +17,17 @@ import asyncio
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from aimakerspace.openai_utils.chatmodel import ChatOpenAI
+from aimakerspace.history_utils import ConversationHistoryManager
 
 # Global storage for vector database
 global_vector_db = None
 
+# Keeps each chat prompt within a token budget by summarizing or dropping older turns.
+# The budget can be tuned with the CHAT_TOKEN_BUDGET environment variable.
+history_manager = ConversationHistoryManager(
+    token_budget=int(os.getenv("CHAT_TOKEN_BUDGET", "6000"))
+)
+
 def build_enhanced_system_message(user_message: str) -> str:
     """
     Build an aligned system message, incorporating relevant document context if available.
@@ -110,23 +117,20 @@ async def chat(request: ChatRequest):
         if ChatOpenAI is None:
             raise HTTPException(status_code=500, detail="ChatOpenAI module not available")
         
-        # Build messages with conversation history
-        messages = []
-        
         # Build the system message
         system_message = build_enhanced_system_message(request.current_user_message)
 
-        # Add system message
-        messages.append({"role": "system", "content": system_message})
-        
-        # Add conversation history
-        messages.extend(request.conversation_history)
-        
-        # Add current user message
-        messages.append({"role": "user", "content": request.current_user_message})
-        
         # Initialize ChatOpenAI
         chat_model = ChatOpenAI(model_name="gpt-4o-mini", api_key=request.api_key)
+
+        # Build messages: system message, recent history (older turns summarized
+        # or dropped to fit the token budget) and the current user message
+        messages = await history_manager.build_messages(
+            system_message,
+            request.conversation_history,
+            request.current_user_message,
+            chat_model=chat_model,
+        )
         
         # Use async streaming method
         async def generate():
@@ -0,0 +1,249 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aimakerspace.openai_utils.chatmodel import (
+    ChatOpenAI,
+    _AdaptiveLimiter,
+    _retry_delay_from_headers,
+)
+
+
+class MockChatServer(ThreadingHTTPServer):
+    """Local chat-completions endpoint that scripts errors per message text."""
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), MockChatHandler)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.arrivals = []
+        self.failures = {
+            "rate-limited": [429],
+            "flaky": [503],
+            "boom": [400] * 10,
+            "no-quota": ["quota"] * 10,
+        }
+        self.delays = {"slow": 0.3}
+        self.success_headers = {
+            "exhaust": {
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": "300ms",
+            }
+        }
+
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        text = body["messages"][-1]["content"]
+        with server.lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.arrivals.append((time.monotonic(), text, server.in_flight))
+            pending = server.failures.get(text)
+            status = pending.pop(0) if pending else 200
+        try:
+            time.sleep(server.delays.get(text, 0.02))
+            headers = {}
+            if status == 200:
+                payload = {
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": body["model"],
+                    "choices": [
+                        {
+                            "index": 0,
+                            "finish_reason": "stop",
+                            "message": {"role": "assistant", "content": text.upper()},
+                        }
+                    ],
+                    "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+                }
+                headers = server.success_headers.get(text, {})
+            elif status == "quota":
+                status = 429
+                payload = {
+                    "error": {
+                        "message": "quota exceeded",
+                        "type": "insufficient_quota",
+                        "code": "insufficient_quota",
+                    }
+                }
+            else:
+                payload = {"error": {"message": f"status {status}", "type": "mock"}}
+                if status == 429:
+                    headers = {"retry-after-ms": "50"}
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+
+@pytest.fixture
+def mock_server():
+    server = MockChatServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def mock_chat(server):
+    return ChatOpenAI(
+        api_key="test-key", base_url=f"http://127.0.0.1:{server.server_port}/v1"
+    )
+
+
+def as_batch(texts):
+    return [[{"role": "user", "content": text}] for text in texts]
+
+
+def test_abatch_against_mock_server(mock_server):
+    chat = mock_chat(mock_server)
+    texts = [f"report {i}" for i in range(12)] + ["rate-limited", "flaky", "boom"]
+    batch = as_batch(texts)
+
+    result = asyncio.run(chat.abatch(batch, max_concurrency=3, max_retries=3))
+
+    assert [item.index for item in result.results] == list(range(len(texts)))
+    assert result.outputs[:-1] == [text.upper() for text in texts[:-1]]
+    assert [item.index for item in result.errors] == [len(texts) - 1]
+    assert result.results[-1].output is None
+    assert result.results[-1].attempts == 1
+    assert result.results[texts.index("rate-limited")].attempts == 2
+    assert result.results[texts.index("flaky")].attempts == 2
+    assert mock_server.max_in_flight <= 3
+    assert result.usage == {
+        "prompt_tokens": 3 * (len(texts) - 1),
+        "completion_tokens": 2 * (len(texts) - 1),
+        "total_tokens": 5 * (len(texts) - 1),
+    }
+
+
+def test_quota_errors_fail_immediately(mock_server):
+    chat = mock_chat(mock_server)
+
+    result = asyncio.run(chat.abatch(as_batch(["no-quota"]), max_retries=3))
+
+    assert result.results[0].attempts == 1
+    assert result.results[0].error.code == "insufficient_quota"
+
+
+def test_abatch_as_completed_yields_in_completion_order(mock_server):
+    chat = mock_chat(mock_server)
+
+    async def collect():
+        batch = as_batch(["slow", "a", "b", "c"])
+        results = chat.abatch_as_completed(batch, max_concurrency=4)
+        return [item.index async for item in results]
+
+    order = asyncio.run(collect())
+
+    assert sorted(order) == [0, 1, 2, 3]
+    assert order[-1] == 0
+
+
+def test_abatch_as_completed_break_stops_remaining_work(mock_server):
+    chat = mock_chat(mock_server)
+
+    async def first_then_break():
+        async for item in chat.abatch_as_completed(
+            as_batch([f"report {i}" for i in range(20)]), max_concurrency=2
+        ):
+            break
+        await asyncio.sleep(0.2)
+        return item
+
+    first = asyncio.run(first_then_break())
+
+    assert first.ok
+    assert mock_server.requests <= 3
+
+
+def test_exhausted_request_window_pauses_before_next_request(mock_server):
+    chat = mock_chat(mock_server)
+
+    result = asyncio.run(
+        chat.abatch(as_batch(["exhaust", "next"]), max_concurrency=1)
+    )
+
+    assert result.outputs == ["EXHAUST", "NEXT"]
+    (first_at, _, _), (second_at, _, _) = mock_server.arrivals
+    assert second_at - first_at >= 0.3
+
+
+def test_limit_grows_back_after_rate_limit(mock_server):
+    chat = mock_chat(mock_server)
+    texts = ["rate-limited"] + [f"report {i}" for i in range(40)]
+
+    result = asyncio.run(chat.abatch(as_batch(texts), max_concurrency=4))
+
+    assert not result.errors
+    arrivals = mock_server.arrivals
+    retry_at = [at for at, text, _ in arrivals if text == "rate-limited"][1]
+    after_pause = [in_flight for at, _, in_flight in arrivals if at >= retry_at]
+    # Halved after the 429 (regrowing one step per run of successes), then
+    # back up to the full 4.
+    assert max(after_pause[:3]) < 4
+    assert max(after_pause[-10:]) == 4
+
+
+def test_retry_delay_from_headers():
+    assert (
+        _retry_delay_from_headers({"retry-after": "0", "x-ratelimit-reset-requests": "6s"})
+        == 0.0
+    )
+    assert _retry_delay_from_headers({"x-ratelimit-reset-requests": "1m30s"}) == 90.0
+    # A token-limit 429 waits for the exhausted token window.
+    assert (
+        _retry_delay_from_headers(
+            {
+                "x-ratelimit-remaining-requests": "10",
+                "x-ratelimit-reset-requests": "1s",
+                "x-ratelimit-remaining-tokens": "0",
+                "x-ratelimit-reset-tokens": "20s",
+            }
+        )
+        == 20.0
+    )
+    # Without a remaining count, the longer window wins.
+    assert (
+        _retry_delay_from_headers(
+            {"x-ratelimit-reset-requests": "2s", "x-ratelimit-reset-tokens": "5s"}
+        )
+        == 5.0
+    )
+
+
+def test_limiter_halves_once_per_burst():
+    async def burst():
+        limiter = _AdaptiveLimiter(8)
+        for _ in range(8):
+            await limiter.record_rate_limited(0.5)
+        return limiter.limit
+
+    assert asyncio.run(burst()) == 4
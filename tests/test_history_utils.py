@@ -0,0 +1,199 @@
+import asyncio
+import os
+import sys
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from aimakerspace.history_utils import (
+    SUMMARY_PREFIX,
+    ConversationHistoryManager,
+    TokenCounter,
+)
+
+
+class FakeChatModel:
+    """Stand-in for ``ChatOpenAI`` that returns numbered or fixed summaries."""
+
+    def __init__(self, summary: str = None, error: Exception = None):
+        self.summary = summary
+        self.error = error
+        self.calls = []
+
+    async def arun(self, messages, **kwargs):
+        self.calls.append({"messages": messages, **kwargs})
+        if self.error is not None:
+            raise self.error
+        return self.summary or f"summary {len(self.calls)}"
+
+
+class CountingTokenCounter(TokenCounter):
+    def __init__(self):
+        super().__init__()
+        self.text_counts = 0
+
+    def count_text(self, text):
+        self.text_counts += 1
+        return super().count_text(text)
+
+
+def turn(index):
+    return [
+        {"role": "user", "content": f"question {index} " + "x" * 210},
+        {"role": "assistant", "content": f"answer {index} " + "y" * 210},
+    ]
+
+
+def run_conversation(manager, chat_model, turns):
+    """Play ``turns`` chat turns and return ``(prompts, histories)``."""
+
+    async def conversation():
+        history = []
+        prompts, histories = [], []
+        for index in range(turns):
+            user_message = turn(index)[0]["content"]
+            prompts.append(
+                await manager.build_messages("sys", history, user_message, chat_model)
+            )
+            histories.append(list(history))
+            await manager.wait_for_summaries()
+            history += turn(index)
+        return prompts, histories
+
+    return asyncio.run(conversation())
+
+
+def summaries_in(prompt):
+    return [m["content"] for m in prompt if m["content"].startswith(SUMMARY_PREFIX)]
+
+
+def verbatim_history(prompt):
+    """Return the history part of ``prompt`` (no system, summary or user message)."""
+
+    return [m for m in prompt[1:-1] if not m["content"].startswith(SUMMARY_PREFIX)]
+
+
+def test_prompt_with_summary_stays_within_budget():
+    manager = ConversationHistoryManager(token_budget=300, summary_token_budget=50)
+    chat_model = FakeChatModel("s" * 200)
+
+    prompts, _ = run_conversation(manager, chat_model, turns=10)
+
+    assert all(manager.counter.count_messages(p) <= 300 for p in prompts)
+    assert summaries_in(prompts[-1])
+
+
+def test_overlong_summary_is_trimmed_not_dropped():
+    manager = ConversationHistoryManager(token_budget=300, summary_token_budget=50)
+    chat_model = FakeChatModel(" ".join(["word"] * 80))
+
+    prompts, _ = run_conversation(manager, chat_model, turns=10)
+
+    assert all(manager.counter.count_messages(p) <= 300 for p in prompts)
+    assert summaries_in(prompts[-1])
+    assert all(
+        call["max_tokens"] < manager.summary_token_budget for call in chat_model.calls
+    )
+
+
+def test_newest_turns_are_kept_verbatim_and_in_order():
+    manager = ConversationHistoryManager(token_budget=600, summary_token_budget=50)
+
+    prompts, histories = run_conversation(manager, FakeChatModel(), turns=8)
+
+    for prompt, history in zip(prompts, histories):
+        kept = verbatim_history(prompt)
+        assert kept == history[len(history) - len(kept) :]
+    assert 0 < len(verbatim_history(prompts[-1])) < len(histories[-1])
+    assert prompts[-1][-1] == {"role": "user", "content": turn(7)[0]["content"]}
+
+
+def test_turns_are_dropped_while_summary_is_pending():
+    manager = ConversationHistoryManager(token_budget=400, summary_token_budget=50)
+    chat_model = FakeChatModel()
+    history = turn(0) + turn(1) + turn(2) + turn(3)
+
+    async def first_eviction():
+        prompt = await manager.build_messages("sys", history, "next", chat_model)
+        scheduled = len(manager._tasks)
+        await manager.wait_for_summaries()
+        return prompt, scheduled
+
+    prompt, scheduled = asyncio.run(first_eviction())
+
+    assert summaries_in(prompt) == []
+    kept = verbatim_history(prompt)
+    assert kept == history[len(history) - len(kept) :]
+    assert len(kept) < len(history)
+    assert scheduled == 1
+    assert len(chat_model.calls) == 1
+
+
+def test_summary_is_maintained_incrementally():
+    manager = ConversationHistoryManager(token_budget=400, summary_token_budget=50)
+    chat_model = FakeChatModel()
+
+    prompts, _ = run_conversation(manager, chat_model, turns=8)
+
+    assert len(chat_model.calls) >= 2
+    first_input = chat_model.calls[0]["messages"][-1]["content"]
+    second_input = chat_model.calls[1]["messages"][-1]["content"]
+    assert first_input.startswith("Existing summary:\n(none)")
+    assert second_input.startswith("Existing summary:\nsummary 1\n")
+    # Each call only receives turns the previous summary does not cover.
+    assert "question 0 " not in second_input
+    # Later prompts use a summary built on top of earlier ones.
+    [latest] = summaries_in(prompts[-1])
+    assert int(latest.rsplit(" ", 1)[1]) >= 2
+
+
+def test_token_counts_are_cached_by_message_hash():
+    counter = CountingTokenCounter()
+    manager = ConversationHistoryManager(token_budget=600, counter=counter)
+    history = turn(0) + turn(1)
+
+    async def build_twice():
+        await manager.build_messages("sys", history, "next")
+        first = counter.text_counts
+        await manager.build_messages("sys", [dict(m) for m in history], "next")
+        return first, counter.text_counts
+
+    first, second = asyncio.run(build_twice())
+
+    assert first == len(history) + 2
+    assert second == first
+
+
+def test_summarizer_input_is_bounded_for_long_uncovered_history():
+    manager = ConversationHistoryManager(
+        token_budget=6000, summary_input_token_budget=8000, max_summary_chunks=4
+    )
+    chat_model = FakeChatModel()
+    history = [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"{i} " + "z" * 2000}
+        for i in range(600)
+    ]
+
+    async def build():
+        prompt = await manager.build_messages("sys", history, "next", chat_model)
+        await manager.wait_for_summaries()
+        return prompt
+
+    prompt = asyncio.run(build())
+
+    assert 0 < len(chat_model.calls) <= 4
+    for call in chat_model.calls:
+        assert manager.counter.count_messages(call["messages"]) <= 8000 + 200
+    # The newest evicted turns are the ones folded into the summary.
+    evicted = len(history) - len(verbatim_history(prompt))
+    last_input = chat_model.calls[-1]["messages"][-1]["content"]
+    assert f"\n{history[evicted - 1]['role']}: {evicted - 1} " in last_input
+
+
+def test_failed_summary_is_not_retried_every_turn():
+    manager = ConversationHistoryManager(token_budget=600, summary_token_budget=50)
+    chat_model = FakeChatModel(error=RuntimeError("context length exceeded"))
+
+    prompts, _ = run_conversation(manager, chat_model, turns=8)
+
+    assert len(chat_model.calls) == 1
+    assert all(summaries_in(prompt) == [] for prompt in prompts)